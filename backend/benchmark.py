@@ -0,0 +1,303 @@
+# backend/benchmark.py
+"""
+Offline load test for the FastAPI backend.
+
+Starts main.py's app against the stand-ins in local_services.py (mongomock or
+a local mongod, an in-memory vector store, a fake GCS bucket and a
+deterministic fake LLM) and drives a weighted mix of upload, chat, progress and
+generate-response traffic, reporting p50/p95/p99 latency and requests/sec.
+
+    python benchmark.py --requests 500 --concurrency 20 --llm-latency-ms 300
+    python benchmark.py --mix generate=1 --transport http --json results.json
+    python benchmark.py --mix progress=10,chat=1
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "upload=1,chat=4,generate=5"
+
+QUERIES = [
+    "What is symmetric encryption?",
+    "Explain the difference between confidentiality and integrity.",
+    "Summarise the key ideas on this page.",
+    "What are authentication protocols used for?",
+    "Give an example of a data integrity algorithm.",
+]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("upload", "chat", "generate", "progress"):
+            raise SystemExit(f"Unknown traffic type in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile: the smallest sample with at least pct% of samples at or below it."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def load_app(args, workdir):
+    """Installs the stand-ins and imports main from a scratch working directory."""
+    import local_services
+
+    local_services.install(
+        mongo_uri=args.mongo_uri,
+        llm_latency=args.llm_latency_ms / 1000,
+        astra_latency=args.astra_latency_ms / 1000,
+        gcs_latency=args.gcs_latency_ms / 1000,
+    )
+    # main.py writes uploads/ and json_files/ relative to the cwd
+    os.chdir(workdir)
+    import main
+    return main.app
+
+
+class Session:
+    """Per-run fixtures: an authenticated user, their uploaded books and chats."""
+
+    def __init__(self, client, pdfs):
+        self.client = client
+        self.pdfs = pdfs
+        self.username = f"bench-{random.randrange(1 << 30)}"
+        self.headers = {}
+        self.books = []  # (collection_name, userId, bookId)
+        self.upload_count = 0
+
+    async def setup(self):
+        r = await self.client.post("/register", json={"username": self.username, "password": "bench"})
+        r.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        for pdf in self.pdfs:
+            r = await self.upload(pdf)
+            r.raise_for_status()
+            collection_name = r.json()["collection_name"]
+            r = await self.client.get("/get-chat-ids", params={"collection_name": collection_name, "username": self.username})
+            r.raise_for_status()
+            ids = r.json()
+            r = await self.client.post("/chats/", json={"userId": ids["userId"], "bookId": ids["bookId"]}, headers=self.headers)
+            r.raise_for_status()
+            self.books.append((collection_name, ids["userId"], ids["bookId"]))
+
+    async def upload(self, pdf):
+        self.upload_count += 1
+        with open(pdf, "rb") as f:
+            content = f.read()
+        # Distinct file names so concurrent uploads don't write the same path
+        name = f"{self.upload_count}-{os.path.basename(pdf)}"
+        return await self.client.post(
+            "/upload/",
+            files={"file": (name, content, "application/pdf")},
+            data={"username": self.username},
+            headers=self.headers,
+        )
+
+    async def chat(self):
+        _, user_id, book_id = random.choice(self.books)
+        r = await self.client.post(
+            f"/chats/{book_id}/messages",
+            json={"userId": user_id, "role": "user", "content": random.choice(QUERIES)},
+        )
+        if r.status_code == 200:
+            r = await self.client.get(f"/chats/{book_id}", params={"userId": user_id})
+        return r
+
+    async def progress(self):
+        collection_name, _, _ = random.choice(self.books)
+        return await self.client.post(
+            f"/books/{collection_name}/progress",
+            json={"page": random.randint(1, 40), "totalPages": 40},
+            headers=self.headers,
+        )
+
+    async def generate(self):
+        collection_name, user_id, book_id = random.choice(self.books)
+        return await self.client.post(
+            "/generate-response/",
+            json={
+                "query": random.choice(QUERIES),
+                "template": "You are a helpful tutor.",
+                "collection_name": collection_name,
+                "userId": user_id,
+                "bookId": book_id,
+            },
+            headers=self.headers,
+        )
+
+
+async def drive(session, mix, total, concurrency):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = random.choices(names, weights=weights, k=total)
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    async def worker():
+        while True:
+            try:
+                kind = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                if kind == "upload":
+                    response = await session.upload(random.choice(session.pdfs))
+                else:
+                    response = await getattr(session, kind)()
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies[kind].append(time.perf_counter() - start)
+            if not ok:
+                errors[kind] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarise(latencies, errors, elapsed):
+    rows = {}
+    everything = []
+    for kind, samples in latencies.items():
+        everything.extend(samples)
+        rows[kind] = _row(samples, errors[kind], elapsed)
+    rows["total"] = _row(everything, sum(errors.values()), elapsed)
+    return rows
+
+
+def _row(samples, errors, elapsed):
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def print_report(rows, elapsed, args):
+    print(
+        f"\n{args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f}s "
+        f"(llm {args.llm_latency_ms}ms, astra {args.astra_latency_ms}ms, gcs {args.gcs_latency_ms}ms)"
+    )
+    print(f"{'type':<10} {'count':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, row in rows.items():
+        print(
+            f"{kind:<10} {row['requests']:>6} {row['errors']:>6} {row['rps']:>8.1f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+        )
+
+
+def start_http_server(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run(args, app):
+    import httpx
+
+    server = None
+    if args.transport == "http":
+        server, thread = start_http_server(app, args.port)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+
+    try:
+        async with app.router.lifespan_context(app) if server is None else _noop():
+            async with client:
+                pdfs = [os.path.join("uploads", name) for name in sorted(os.listdir("uploads")) if name.endswith(".pdf")]
+                session = Session(client, pdfs[: args.books])
+                await session.setup()
+
+                if args.warmup:
+                    await drive(session, args.mix, args.warmup, args.concurrency)
+                latencies, errors, elapsed = await drive(session, args.mix, args.requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+
+    return summarise(latencies, errors, elapsed), elapsed
+
+
+class _noop:
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="Measured requests (default 300)")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured warm-up requests")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Traffic weights (default {DEFAULT_MIX})")
+    parser.add_argument("--books", type=int, default=3, help="Sample PDFs from uploads/ to load")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--astra-latency-ms", type=float, default=20)
+    parser.add_argument("--gcs-latency-ms", type=float, default=30)
+    parser.add_argument("--mongo-uri", default=None, help="Use a local mongod instead of mongomock")
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi",
+                        help="asgi: in-process calls; http: real uvicorn server on --port")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sys.path.insert(0, BACKEND_DIR)
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    workdir = tempfile.mkdtemp(prefix="rask-bench-")
+    try:
+        shutil.copytree(os.path.join(BACKEND_DIR, "uploads"), os.path.join(workdir, "uploads"))
+        app = load_app(args, workdir)
+        rows, elapsed = asyncio.run(run(args, app))
+    finally:
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(rows, elapsed, args)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "json_path"}, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
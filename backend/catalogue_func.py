@@ -0,0 +1,137 @@
+# backend/catalogue_func.py
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from connect_to_mongo import db
+
+book_collection = db["book"]
+version_collection = db["catalogue_versions"]
+
+BOOK_FIELDS = {
+    "title", "fileUrl", "uploadDate", "progress", "collectionName", "lastReadPage",
+    "progressUpdatedAt", "username", "index",
+}
+# The index record is internal; clients get it only by asking with `fields`
+DEFAULT_BOOK_FIELDS = BOOK_FIELDS - {"index"}
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_BATCH_SIZE = 200
+
+
+def parse_fields(fields: str | None, allowed=BOOK_FIELDS, default=DEFAULT_BOOK_FIELDS):
+    """Turns `fields=title,progress` into a Mongo projection; without `fields`, projects `default`."""
+    if not fields:
+        return {field: 1 for field in default}
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - allowed
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {field: 1 for field in requested}
+
+
+def parse_cursor(after: str | None):
+    if not after:
+        return None
+    try:
+        return ObjectId(after)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def page_query(collection, query: dict, projection, limit: int, after=None):
+    """
+    Keyset pagination on _id: returns (documents without _id, cursor for the next page or None).
+    Cost depends on `limit`, not on how many documents precede the page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if after is not None:
+        query = {**query, "_id": {"$gt": after}}
+    projection = {**projection, "_id": 1} if projection else None
+
+    docs = list(collection.find(query, projection).sort("_id", 1).limit(limit + 1))
+    next_cursor = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    for doc in docs:
+        doc.pop("_id", None)
+    return docs[:limit], next_cursor
+
+
+def stream_ndjson(collection, query: dict, projection):
+    """Yields every matching document as one JSON line, fetching in batches."""
+    projection = {**(projection or {}), "_id": 0}
+    cursor = collection.find(query, projection).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+    for doc in cursor:
+        yield json.dumps(doc, default=str) + "\n"
+
+
+# ---------- Per-user catalogue cache ----------
+#
+# Each user's catalogue has a version number in Mongo, shared by all workers.
+# Cached pages are keyed on that version, so bumping it (on upload or
+# progress changes) invalidates the user's pages in every worker; a cache hit
+# costs one _id lookup instead of a scan of the user's books.
+
+class CatalogueCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+catalogue_cache = CatalogueCache(int(os.getenv("CATALOGUE_CACHE_SIZE", 1000)))
+
+
+def catalogue_version(username: str) -> int:
+    doc = version_collection.find_one({"_id": username}, {"version": 1})
+    return doc["version"] if doc else 0
+
+
+def invalidate_catalogue(usernames):
+    """Bumps the catalogue version of the given users."""
+    usernames = [usernames] if isinstance(usernames, str) else list(set(usernames))
+    if not usernames:
+        return
+    version_collection.bulk_write(
+        [UpdateOne({"_id": name}, {"$inc": {"version": 1}}, upsert=True) for name in usernames],
+        ordered=False,
+    )
+
+
+def invalidate_book(collection_name: str):
+    """Invalidates the catalogue of every user who has this book."""
+    invalidate_catalogue(book_collection.distinct("username", {"collectionName": collection_name}))
+
+
+def get_books_page(username: str, limit: int, after: str | None, fields: str | None):
+    """Returns (books, next cursor) for a user, served from the catalogue cache when current."""
+    projection = parse_fields(fields)
+    cursor = parse_cursor(after)
+    key = (username, catalogue_version(username), limit, after, fields)
+
+    cached = catalogue_cache.get(key)
+    if cached is not None:
+        return cached
+
+    page = page_query(book_collection, {"username": username}, projection, limit, cursor)
+    catalogue_cache.put(key, page)
+    return page
@@ -0,0 +1,142 @@
+# backend/chunk_store.py
+"""
+Compact on-disk format for a book's extracted chunks.
+
+A store is two files:
+  <name>.jsonl.gz   one gzip member per page, each holding that page's chunks
+                    as line-delimited JSON. Concatenated gzip members are a
+                    valid gzip file, so the whole store streams with gzip.open.
+  <name>.idx.json   page -> [byte offset, byte length] of the page's member,
+                    for random access to a single page without decompressing
+                    the rest.
+
+Convert the old indented JSON files with:
+    python chunk_store.py convert json_files/*.json [--delete]
+"""
+import gzip
+import json
+import os
+
+STORE_SUFFIX = ".jsonl.gz"
+INDEX_SUFFIX = ".idx.json"
+FORMAT_VERSION = 1
+
+
+def store_path(folder: str, filename: str) -> str:
+    """Path of the chunk store for an uploaded file name (e.g. 'book.pdf')."""
+    return os.path.join(folder, f"{filename}{STORE_SUFFIX}")
+
+
+def index_path(path: str) -> str:
+    return path[: -len(STORE_SUFFIX)] + INDEX_SUFFIX
+
+
+def write_chunks(path: str, chunks) -> dict:
+    """
+    Writes chunks (dicts with a 'page' key) to a store at `path`.
+
+    Chunks are grouped by page, so input need not be sorted: pages are
+    stored in order of first appearance, chunks within a page in input
+    order. Both files are written to temporary names and renamed into
+    place, so readers never see a half-written store. Returns the index.
+    """
+    by_page = {}
+    count = 0
+    for chunk in chunks:
+        # A page split across the input must still be a single gzip member
+        by_page.setdefault(str(chunk.get("page")), []).append(
+            json.dumps(chunk, ensure_ascii=False, separators=(",", ":"))
+        )
+        count += 1
+
+    pages = {}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for page, lines in by_page.items():
+            member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), mtime=0)
+            pages[page] = [out.tell(), len(member)]
+            out.write(member)
+
+    index = {"version": FORMAT_VERSION, "chunks": count, "pages": pages}
+    tmp_index = index_path(path) + ".tmp"
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+    os.replace(tmp_path, path)
+    os.replace(tmp_index, index_path(path))
+    return index
+
+
+def load_index(path: str) -> dict:
+    with open(index_path(path), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_chunks(path: str):
+    """Yields chunks one at a time. Also reads legacy `.json` chunk files."""
+    if not path.endswith(STORE_SUFFIX):
+        with open(path, "r", encoding="utf8") as f:
+            yield from json.load(f)
+        return
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_page(path: str, page: int, index: dict = None):
+    """Returns the chunks of one page, or None if the page is not in the store."""
+    index = index or load_index(path)
+    location = index["pages"].get(str(page))
+    if location is None:
+        return None
+
+    offset, length = location
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length)).decode("utf-8")
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+
+def iter_json_array(path: str, batch_size: int = 200):
+    """Streams a store as the JSON array the legacy `.json` files contained."""
+    yield "["
+    batch = []
+    first = True
+    for chunk in iter_chunks(path):
+        batch.append(json.dumps(chunk, ensure_ascii=False))
+        if len(batch) >= batch_size:
+            yield ("" if first else ",") + ",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ("" if first else ",") + ",".join(batch)
+    yield "]"
+
+
+def convert_json(json_path: str, delete: bool = False) -> str:
+    """Converts a legacy indented `<name>.json` chunk file to a store next to it."""
+    base = json_path[: -len(".json")] if json_path.endswith(".json") else json_path
+    path = base + STORE_SUFFIX
+    write_chunks(path, iter_chunks(json_path))
+    if delete:
+        os.remove(json_path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chunk store utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Convert legacy .json chunk files")
+    convert.add_argument("files", nargs="+")
+    convert.add_argument("--delete", action="store_true", help="Remove the .json file after converting")
+    args = parser.parse_args()
+
+    for json_file in args.files:
+        before = os.path.getsize(json_file)
+        out = convert_json(json_file, delete=args.delete)
+        after = os.path.getsize(out) + os.path.getsize(index_path(out))
+        print(f"{json_file} -> {out}: {before} -> {after} bytes ({100 * after / before:.0f}%)")
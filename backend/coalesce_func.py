@@ -0,0 +1,60 @@
+# backend/coalesce_func.py
+import asyncio
+import hashlib
+import json
+
+from starlette.concurrency import run_in_threadpool
+
+from metrics_func import COALESCED_CALLS
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query, for coalescing keys."""
+    return " ".join((text or "").split()).casefold()
+
+
+def history_key(conversation_history) -> str:
+    """Short digest of a conversation history, so callers with different histories never share an answer."""
+    payload = json.dumps(conversation_history, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller for a key (the leader) runs the blocking function in the
+    threadpool; callers arriving while it runs await the same result. With
+    `linger` > 0 a successful, non-empty result is also reused for that many
+    seconds after it completes, so a burst spread over a short window still
+    costs one upstream call.
+    """
+
+    def __init__(self, name: str, linger: float = 0.0):
+        self.name = name
+        self.linger = linger
+        self._calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is not None:
+            COALESCED_CALLS.inc(call=self.name, role="follower")
+        else:
+            COALESCED_CALLS.inc(call=self.name, role="leader")
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+
+        # shield: a disconnecting client must not cancel work others wait on
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        keep = self.linger > 0 and not task.cancelled() and task.exception() is None and task.result()
+        if keep:
+            asyncio.get_running_loop().call_later(self.linger, self._forget, key, task)
+        else:
+            self._forget(key, task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -2,6 +2,9 @@
 import os
 from dotenv import load_dotenv
 from astrapy import DataAPIClient, Database
+from metrics_func import get_logger
+
+logger = get_logger("astra")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,7 +23,7 @@ def connect_to_database() -> Database:
     client = DataAPIClient(token)
     database = client.get_database(endpoint)
 
-    print(f"Connected to database {database.info().name}")
+    logger.info(f"Connected to database {database.info().name}")
     return database
 
 database = connect_to_database()  # Global database connection
\ No newline at end of file
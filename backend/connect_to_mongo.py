@@ -4,6 +4,9 @@ from pymongo.server_api import ServerApi
 import os
 from dotenv import load_dotenv
 from pymongo.errors import ConnectionFailure, ConfigurationError
+from metrics_func import get_logger
+
+logger = get_logger("mongo")
 
 load_dotenv()
 
@@ -17,13 +20,13 @@ def connect_to_mongo():
         # Test the connection
         client.admin.command("ping")  
         db = client[DB_NAME]
-        print("Connected to MongoDB")
+        logger.info("Connected to MongoDB")
 
         ensure_indexes(db)
 
         return db
     except (ConnectionFailure, ConfigurationError) as e:
-        print(f"MongoDB Connection Error: {e}")
+        logger.error(f"MongoDB Connection Error: {e}")
         return None
 
 def ensure_indexes(db):
@@ -37,9 +40,13 @@ def ensure_indexes(db):
         
         # Index for message timestamp pagination
         db.chats.create_index([("messages.timestamp", 1)])
+
+        # Book lookups by content hash (index version, uploads) and per user
+        db.book.create_index([("collectionName", 1), ("username", 1)])
+        db.book.create_index([("username", 1), ("_id", 1)])
         
-        print("Database indexes verified/created")
+        logger.info("Database indexes verified/created")
     except Exception as e:
-        print(f"Index creation failed: {e}")
+        logger.error(f"Index creation failed: {e}")
     
 db = connect_to_mongo()  # Global database connection
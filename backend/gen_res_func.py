@@ -1,9 +1,15 @@
 # backend/gen_res_func.py
 from connect_to_database import database
 from vertexai.generative_models import GenerativeModel
-import json
+from prompt_func import build_prompt, log_prompt_metrics
+from metrics_func import get_logger, span, record_llm_tokens
+from lifecycle import track_llm_call
 
-def query_astra_db(query_text: str, collection_name: str, book_id: str = None):
+logger = get_logger("gen_res")
+
+CHAT_MODEL = "gemini-2.0-flash"
+
+def query_astra_db(query_text: str, collection_name: str, book_id: str = None, index_version: str = None):
     """
     Queries AstraDB with optional filtering by `book_id` before vector search.
     
@@ -11,68 +17,53 @@ def query_astra_db(query_text: str, collection_name: str, book_id: str = None):
         query_text: Text to vectorize and search.
         collection_name: Name of the collection (e.g., "books").
         book_id: Optional filter to scope results to a specific book.
+        index_version: Optional index version the chunks must belong to.
     Returns:
-        Context string or empty if error.
+        List of matching chunk texts in rank order, or empty if error.
     """
-    print("Querying AstraDB.......")
+    logger.info("Querying AstraDB", extra={"fields": {"book_id": book_id}})
     try:
         collection = database.get_collection(collection_name)
         
         # Build the query
         query_filter = {"book_id": book_id} if book_id else {}
+        if index_version:
+            query_filter["index_versions"] = {"$in": [index_version]}
         query_vector = {"$vectorize": f"text: {query_text}"}
         
         # Execute filtered vector search
-        cursor = collection.find(
-            filter=query_filter, 
-            sort=query_vector,
-            limit=5               # Top 5 matches
-        )
-        
-        results = list(cursor)
+        with span("astra.vector_search", book_id=book_id):
+            cursor = collection.find(
+                filter=query_filter, 
+                sort=query_vector,
+                limit=5               # Top 5 matches
+            )
+            results = list(cursor)
+
         if not results:
-            print("⚠️ No matching results found.")
-            return ""
+            logger.warning("No matching results found")
+            return []
         
         # print(results)
         
-        # Format results for Gemini/LLM input
-        doc_context = "\n".join(
-            f"{i}. {doc.get('text', 'No text found')}"
-            for i, doc in enumerate(results, 1)
-        )
-        return doc_context
+        # Numbering and budgeting happen in build_prompt()
+        return [doc.get("text", "") for doc in results]
 
     except Exception as e:
-        print(f"❌ Error querying AstraDB: {e}")
-        return ""
+        logger.error(f"Error querying AstraDB: {e}")
+        return []
 
-def generate_chat_response(query, template, context,conversation_history):
+def generate_chat_response(query, template, context, conversation_history):
     """Generates response using Gemini-Pro."""
-    model = GenerativeModel("gemini-2.0-flash")
-
-    # Format conversation history
-    history_str = "\n".join(
-        f"{msg['role'].upper()}: {msg['content']}" 
-        for msg in conversation_history
-    )
+    model = GenerativeModel(CHAT_MODEL)
 
-    prompt = f"""
-    {template}
+    prompt, metrics = build_prompt(query, template, context, conversation_history, CHAT_MODEL)
+    log_prompt_metrics(metrics)
 
-    CONVERSATION HISTORY:
-    {history_str}
-    -------------
-    DOCUMENT CONTEXT:
-    {json.dumps(context, indent=2)}
-    END CONTEXT
-    -------------
-    CURRENT QUERY : {query}
+    with track_llm_call(), span("llm.generate", model=CHAT_MODEL):
+        response = model.generate_content(prompt)
 
-    INSTRUCTIONS:
-    1. Maintain conversation flow naturally
-    2. Reference previous messages when relevant
-    3. Keep responses concise but helpful
-    """
-    response = model.generate_content(prompt)
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_llm_tokens(CHAT_MODEL, usage.prompt_token_count, usage.candidates_token_count)
     return response.text.strip() if response else "No response received."
\ No newline at end of file
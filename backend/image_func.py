@@ -2,6 +2,9 @@
 from google.cloud import storage
 import uuid
 from datetime import datetime
+from metrics_func import get_logger, span
+
+logger = get_logger("image")
 
 # Google Cloud Storage setup
 storage_client = storage.Client()
@@ -25,17 +28,18 @@ def upload_image_to_gcs(file, book_name):
         folder_name = book_name.replace(" ", "-").lower()
         gcs_path = f"{folder_name}/{unique_filename}"
 
-        print(f"🔄 Uploading {gcs_path} to GCS...")
+        logger.info(f"Uploading {gcs_path} to GCS")
 
         bucket = storage_client.bucket(BUCKET_NAME)
         blob = bucket.blob(gcs_path)
-        blob.upload_from_file(file.file)
-        blob.make_public()
+        with span("gcs.upload", kind="image"):
+            blob.upload_from_file(file.file)
+            blob.make_public()
 
         return blob.public_url
 
     except Exception as e:
-        print(f"❌ Error uploading image to GSC: {e}")
+        logger.error(f"Error uploading image to GCS: {e}")
         return None
 
 def upload_and_share(file_path, file_name, username):
@@ -51,22 +55,25 @@ def upload_and_share(file_path, file_name, username):
         gcs_path = f"books/{unique_filename}"
 
         # Check if the file already exists
-        if file_exists(BUCKET_NAME, gcs_path):
-            print(f"✅ File already exists: {gcs_path}")
+        with span("gcs.exists"):
+            exists = file_exists(BUCKET_NAME, gcs_path)
+        if exists:
+            logger.info(f"File already exists: {gcs_path}")
             return f"https://storage.googleapis.com/{BUCKET_NAME}/{gcs_path}"
 
         # Upload the new file
         bucket = storage_client.bucket(BUCKET_NAME)
         blob = bucket.blob(gcs_path)
                 # Upload and make the file public
-        with open(file_path, "rb") as file:
-            blob.upload_from_file(file)
+        with span("gcs.upload", kind="book"):
+            with open(file_path, "rb") as file:
+                blob.upload_from_file(file)
 
-        blob.make_public()
+            blob.make_public()
 
-        print(f"🚀 Uploaded: {gcs_path}")
+        logger.info(f"Uploaded: {gcs_path}")
         return f"https://storage.googleapis.com/{BUCKET_NAME}/{gcs_path}"
 
     except Exception as e:
-        print(f"❌ Error uploading file to GSC : {e}")
+        logger.error(f"Error uploading file to GCS: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,270 @@
+# backend/index_func.py
+"""
+Versioned per-book vector indexes.
+
+A book's active index is recorded on its Mongo book documents:
+
+    "index": {"version", "chunker", "embedding", "collection", "chunks", "updatedAt"}
+
+Chunks in AstraDB carry `chunk_hash` and `index_versions` (the index versions
+they belong to). Retrieval filters on the active version, so a re-index can
+build the next version alongside the live one and switch over with a single
+update of the book documents. Books uploaded before versioning have no
+`index` and are queried as before (all chunks with their book_id); their
+first re-index tags those chunks with LEGACY_VERSION and records it as the
+active index before any new chunk is inserted.
+
+Re-index from the command line:
+    python index_func.py <collection_name>... | --all [--force]
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from connect_to_mongo import db
+from chunk_store import store_path, write_chunks, iter_chunks
+from metrics_func import get_logger, span
+from catalogue_func import invalidate_book
+from upload_func import (
+    get_or_create_collection, extract_text_from_pdf, insert_chunks, chunk_hash,
+    CHUNKER_VERSION, EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_VERSION,
+)
+
+logger = get_logger("index")
+
+INDEX_VERSION = f"{CHUNKER_VERSION}|{EMBEDDING_VERSION}"
+# Chunks embedded with this model live in the base collection; other models
+# need their own collection because vectorize is configured per collection.
+BASE_EMBEDDING_VERSION = "nvidia/NV-Embed-QA"
+LEGACY_VERSION = "legacy"
+FILTER_BATCH_SIZE = 100  # Data API limit on $in values
+# A "running" job older than this is treated as abandoned (its worker died)
+JOB_TIMEOUT = timedelta(seconds=int(os.getenv("REINDEX_JOB_TIMEOUT", 3600)))
+
+book_collection = db["book"]
+job_collection = db["index_jobs"]
+
+
+def embedding_collection_name(base_collection: str, embedding_version: str = EMBEDDING_VERSION) -> str:
+    if embedding_version == BASE_EMBEDDING_VERSION:
+        return base_collection
+    return f"{base_collection}_{re.sub(r'[^0-9a-zA-Z]+', '_', embedding_version).lower()}"[:48]
+
+
+def current_index(book_id: str):
+    """Active index record of a book, or None for books indexed before versioning."""
+    book = book_collection.find_one({"collectionName": book_id, "index": {"$exists": True}}, {"index": 1})
+    return book["index"] if book else None
+
+
+def retrieval_target(base_collection: str, book_id: str):
+    """Returns (astra collection name, index version or None) to query for a book."""
+    index = current_index(book_id)
+    if index is None:
+        return base_collection, None
+    return index["collection"], index["version"]
+
+
+def is_current(index) -> bool:
+    return index is not None and index.get("version") == INDEX_VERSION
+
+
+def new_index_record(collection_name: str, chunks: int) -> dict:
+    return {
+        "version": INDEX_VERSION,
+        "chunker": CHUNKER_VERSION,
+        "embedding": EMBEDDING_VERSION,
+        "collection": collection_name,
+        "chunks": chunks,
+        "updatedAt": datetime.utcnow().isoformat(),
+    }
+
+
+def activate_index(book_id: str, index: dict):
+    """Points every user's copy of the book at `index`. Each document switches atomically."""
+    book_collection.update_many({"collectionName": book_id}, {"$set": {"index": index}})
+    invalidate_book(book_id)
+
+
+def adopt_legacy_chunks(book_id: str, base_collection: str) -> dict:
+    """
+    Gives a book indexed before versioning a version-filtered index.
+
+    Its untagged chunks are tagged with LEGACY_VERSION and that version is
+    made active, so retrieval stops matching on book_id alone before a
+    re-index adds chunks of the new version next to them.
+    """
+    collection = get_or_create_collection(base_collection)
+    with span("astra.update_many", book_id=book_id):
+        collection.update_many(
+            {"book_id": book_id, "index_versions": {"$exists": False}},
+            {"$addToSet": {"index_versions": LEGACY_VERSION}},
+        )
+    index = {**new_index_record(base_collection, None), "version": LEGACY_VERSION, "chunker": None,
+             "embedding": BASE_EMBEDDING_VERSION}
+    activate_index(book_id, index)
+    return index
+
+
+def _batches(items, size=FILTER_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _load_chunks(book, upload_folder, json_folder, index):
+    """Re-chunks the uploaded PDF when available, else reuses the stored chunks."""
+    pdf_path = os.path.join(upload_folder, book["title"])
+    chunks_path = store_path(json_folder, book["title"])
+
+    if os.path.exists(pdf_path):
+        chunks = extract_text_from_pdf(pdf_path)
+        write_chunks(chunks_path, chunks)
+        return chunks
+
+    if not os.path.exists(chunks_path):
+        legacy = os.path.join(json_folder, f"{book['title']}.json")
+        chunks_path = legacy if os.path.exists(legacy) else None
+    if chunks_path is None:
+        raise FileNotFoundError(f"Neither the PDF nor stored chunks exist for {book['title']}")
+
+    # Stored chunks can only be reused if the chunker has not changed
+    # (legacy indexes record no chunker and reuse them, as before versioning)
+    if index is not None and index.get("chunker") not in (None, CHUNKER_VERSION):
+        raise FileNotFoundError(f"PDF for {book['title']} is missing; it is needed to re-chunk with {CHUNKER_VERSION}")
+    return list(iter_chunks(chunks_path))
+
+
+def reindex_book(book_id: str, base_collection: str, upload_folder="uploads", json_folder="json_files", force=False):
+    """
+    Builds the current index version for a book, embedding only chunks whose hash changed.
+
+    Unchanged chunks already in the target collection are tagged with the new
+    version instead of being re-embedded. Once the new version is complete the
+    book documents are switched to it and chunks no longer used are deleted.
+    """
+    book = book_collection.find_one({"collectionName": book_id})
+    if not book:
+        raise LookupError(f"Book {book_id} not found")
+
+    old_index = current_index(book_id)
+    if is_current(old_index) and not force:
+        return {"status": "current", "version": INDEX_VERSION}
+
+    chunks = _load_chunks(book, upload_folder, json_folder, old_index)
+    if old_index is None:
+        adopt_legacy_chunks(book_id, base_collection)
+
+    target_name = embedding_collection_name(base_collection)
+    target = get_or_create_collection(target_name, EMBEDDING_PROVIDER, EMBEDDING_MODEL)
+
+    # Existing chunks of this book in the target collection, by content hash.
+    # Legacy chunks have no stored hash, so it is recomputed from their fields.
+    existing = {}
+    with span("astra.find", book_id=book_id):
+        for doc in target.find({"book_id": book_id}, projection={"page": 1, "paragraph": 1, "text": 1, "chunk_hash": 1}):
+            existing.setdefault(doc.get("chunk_hash") or chunk_hash(doc), []).append(doc["_id"])
+
+    reused_ids = []
+    changed = []
+    for chunk in chunks:
+        ids = existing.get(chunk_hash(chunk))
+        if ids:
+            reused_ids.append(ids.pop())
+        else:
+            changed.append(chunk)
+    stale_ids = [doc_id for ids in existing.values() for doc_id in ids]
+
+    for batch in _batches(reused_ids):
+        with span("astra.update_many", book_id=book_id):
+            target.update_many({"_id": {"$in": batch}}, {"$addToSet": {"index_versions": INDEX_VERSION}})
+    inserted = insert_chunks(target, changed, book_id, INDEX_VERSION) if changed else 0
+    if inserted != len(changed):
+        raise RuntimeError(f"Only {inserted} of {len(changed)} changed chunks were inserted")
+
+    new_index = new_index_record(target_name, len(chunks))
+    activate_index(book_id, new_index)
+
+    # The old version is no longer served; drop what only it used
+    for batch in _batches(stale_ids):
+        with span("astra.delete_many", book_id=book_id):
+            target.delete_many({"_id": {"$in": batch}})
+    old_collection = old_index["collection"] if old_index else base_collection
+    if old_collection != target_name:
+        with span("astra.delete_many", book_id=book_id):
+            get_or_create_collection(old_collection).delete_many({"book_id": book_id})
+
+    result = {
+        "status": "reindexed",
+        "version": INDEX_VERSION,
+        "chunks": len(chunks),
+        "reused": len(reused_ids),
+        "embedded": inserted,
+        "deleted": len(stale_ids),
+    }
+    logger.info(f"Re-indexed {book_id}", extra={"fields": result})
+    return result
+
+
+def run_reindex_job(book_id: str, base_collection: str, upload_folder="uploads", json_folder="json_files", force=False):
+    """
+    Runs reindex_book as a tracked job (safe to call from a background task).
+
+    The job document in `index_jobs` is shared by all workers; a second job
+    for the same book is refused while one is running, unless the running one
+    started more than JOB_TIMEOUT ago.
+    """
+    now = datetime.utcnow()
+    try:
+        job_collection.update_one(
+            {"_id": book_id, "$or": [{"status": {"$ne": "running"}}, {"startedAt": {"$lt": now - JOB_TIMEOUT}}]},
+            {"$set": {"status": "running", "startedAt": now, "error": None, "result": None}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        logger.info(f"Re-index already running for {book_id}")
+        return None
+
+    try:
+        result = reindex_book(book_id, base_collection, upload_folder, json_folder, force)
+        job_collection.update_one(
+            {"_id": book_id}, {"$set": {"status": "done", "finishedAt": datetime.utcnow(), "result": result}}
+        )
+        return result
+    except Exception as e:
+        logger.error(f"Re-index failed for {book_id}: {e}")
+        job_collection.update_one(
+            {"_id": book_id}, {"$set": {"status": "failed", "finishedAt": datetime.utcnow(), "error": str(e)}}
+        )
+        return None
+
+
+def get_job(book_id: str):
+    return job_collection.find_one({"_id": book_id}, {"_id": 0})
+
+
+def is_running(job) -> bool:
+    """True if `job` is running and has not exceeded JOB_TIMEOUT."""
+    return bool(job) and job.get("status") == "running" and job["startedAt"] > datetime.utcnow() - JOB_TIMEOUT
+
+
+def stale_books():
+    """collectionNames of books whose active index is missing or not the current version."""
+    return sorted(book_collection.distinct("collectionName", {"index.version": {"$ne": INDEX_VERSION}}))
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=f"Re-index books to {INDEX_VERSION}")
+    parser.add_argument("books", nargs="*", help="collectionName(s) to re-index")
+    parser.add_argument("--all", action="store_true", help="Re-index every book not on the current version")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if already current")
+    args = parser.parse_args()
+
+    base = os.getenv("ASTRA_DB_COLLECTION")
+    for book_id in (stale_books() if args.all else args.books):
+        print(book_id, run_reindex_job(book_id, base, force=args.force) or get_job(book_id))
@@ -0,0 +1,99 @@
+# backend/lifecycle.py
+import asyncio
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics_func import get_logger
+
+logger = get_logger("lifecycle")
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+_draining = False
+_deadline = None
+
+
+@contextmanager
+def track_llm_call():
+    """Counts an in-flight LLM call so shutdown can wait for it to finish."""
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+
+
+def inflight_llm_calls() -> int:
+    return _inflight
+
+
+def is_draining() -> bool:
+    return _draining
+
+
+def begin_drain(timeout: float):
+    """Marks the worker as draining; the shutdown deadline is set by the first call only."""
+    global _draining, _deadline
+    _draining = True
+    if _deadline is None:
+        _deadline = time.monotonic() + timeout
+
+
+def drain_on_signal(timeout: float):
+    """
+    Starts draining as soon as the worker receives SIGINT/SIGTERM.
+
+    uvicorn runs the lifespan shutdown only after it has closed its listeners
+    and waited for open connections, so /ready would otherwise keep reporting
+    ready for most of the shutdown. Call from the lifespan startup: uvicorn
+    installs its own handlers before loading the app, and they are chained.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return  # signals are only delivered to (and settable from) the main thread
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            begin_drain(timeout)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+async def drain(timeout: float):
+    """Waits for in-flight LLM calls until the shutdown deadline (`timeout` from the signal, or from now)."""
+    begin_drain(timeout)
+    if _inflight:
+        logger.info(f"Draining {_inflight} in-flight LLM calls")
+    while _inflight and time.monotonic() < _deadline:
+        await asyncio.sleep(0.1)
+    if _inflight:
+        logger.warning(f"Shutdown timeout reached with {_inflight} LLM calls still running")
+
+
+async def check_dependencies(checks: dict, timeout: float = 3.0):
+    """
+    Runs blocking health checks concurrently in threads.
+
+    `checks` maps a dependency name to a zero-argument callable that raises
+    on failure. Returns ({name: "ok" | error message}, all_ok).
+    """
+    async def run(name, check):
+        try:
+            await asyncio.wait_for(asyncio.to_thread(check), timeout)
+            return name, "ok"
+        except asyncio.TimeoutError:
+            return name, f"timed out after {timeout}s"
+        except Exception as e:
+            return name, str(e) or type(e).__name__
+
+    results = dict(await asyncio.gather(*(run(name, check) for name, check in checks.items())))
+    return results, all(status == "ok" for status in results.values())
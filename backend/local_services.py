@@ -0,0 +1,279 @@
+# backend/local_services.py
+"""
+In-process stand-ins for MongoDB, AstraDB, Google Cloud Storage and the
+Gemini/Vertex LLMs, so main.py can run without any cloud credentials.
+
+Call install() BEFORE importing main (or any module that connects at import
+time). Used by benchmark.py.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from types import SimpleNamespace
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _vectorize_text(doc_or_sort):
+    value = doc_or_sort.get("$vectorize", "") if doc_or_sort else ""
+    return value[len("text: "):] if value.startswith("text: ") else value
+
+
+def _matches(doc, query_filter):
+    """Equality, $in (also against array fields) and $exists, as used by the backend."""
+    for key, condition in (query_filter or {}).items():
+        value = doc.get(key)
+        values = value if isinstance(value, list) else [value]
+        if isinstance(condition, dict):
+            if "$in" in condition and not any(v in condition["$in"] for v in values):
+                return False
+            if "$exists" in condition and (key in doc) != condition["$exists"]:
+                return False
+        elif condition not in values:
+            return False
+    return True
+
+
+# ---------- AstraDB ----------
+
+class FakeVectorCollection:
+    """Keeps documents in memory; $vectorize sorting ranks by word overlap."""
+
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.full_name = f"local.{name}"
+        self.latency = latency
+        self._docs = []
+        self._lock = threading.Lock()
+
+    def insert_many(self, documents):
+        time.sleep(self.latency)
+        ids = []
+        with self._lock:
+            for document in documents:
+                document = dict(document)
+                document.setdefault("_id", uuid.uuid4().hex)
+                document["_words"] = _words(_vectorize_text(document))
+                self._docs.append(document)
+                ids.append(document["_id"])
+        return SimpleNamespace(inserted_ids=ids)
+
+    def find_one(self, filter=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            for document in self._docs:
+                if _matches(document, filter):
+                    return self._public(document)
+        return None
+
+    def find(self, filter=None, sort=None, limit=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            candidates = [d for d in self._docs if _matches(d, filter)]
+        query_words = _words(_vectorize_text(sort))
+        if query_words:
+            candidates.sort(key=lambda d: len(query_words & d["_words"]) / (len(d["_words"]) or 1), reverse=True)
+        return [self._public(d) for d in candidates[:limit]]
+
+    def update_many(self, filter, update, **kwargs):
+        time.sleep(self.latency)
+        count = 0
+        with self._lock:
+            for document in self._docs:
+                if not _matches(document, filter):
+                    continue
+                count += 1
+                document.update(update.get("$set", {}))
+                for key, value in update.get("$addToSet", {}).items():
+                    items = document.setdefault(key, [])
+                    if value not in items:
+                        items.append(value)
+        return SimpleNamespace(update_info={"n": count})
+
+    def delete_many(self, filter=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            before = len(self._docs)
+            self._docs = [d for d in self._docs if not _matches(d, filter)]
+            return SimpleNamespace(deleted_count=before - len(self._docs))
+
+    @staticmethod
+    def _public(document):
+        return {k: v for k, v in document.items() if k not in ("_words", "$vectorize")}
+
+
+class FakeAstraDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def info(self):
+        return SimpleNamespace(name="local-astra")
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+    def create_collection(self, name, **kwargs):
+        return self.get_collection(name)
+
+    def get_collection(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeVectorCollection(name, self.latency)
+            return self._collections[name]
+
+
+class FakeDataAPIClient:
+    database = None
+
+    def __init__(self, token=None, **kwargs):
+        pass
+
+    def get_database(self, endpoint, **kwargs):
+        return FakeDataAPIClient.database
+
+
+# ---------- Google Cloud Storage ----------
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.public_url = f"https://storage.googleapis.com/{bucket.name}/{name}"
+
+    def exists(self):
+        time.sleep(self.bucket.latency)
+        return self.name in self.bucket.objects
+
+    def upload_from_file(self, file):
+        time.sleep(self.bucket.latency)
+        self.bucket.objects[self.name] = file.read()
+
+    def make_public(self):
+        pass
+
+
+class FakeBucket:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.objects = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def exists(self):
+        time.sleep(self.latency)
+        return True
+
+
+class FakeStorageClient:
+    buckets = {}
+    latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, name):
+        if name not in FakeStorageClient.buckets:
+            FakeStorageClient.buckets[name] = FakeBucket(name, FakeStorageClient.latency)
+        return FakeStorageClient.buckets[name]
+
+
+# ---------- LLMs ----------
+
+class FakeGenerativeModel:
+    """Deterministic stand-in for vertexai GenerativeModel; sleeps `latency` per call."""
+
+    latency = 0.0
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(FakeGenerativeModel.latency)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        text = f"[{self.model_name}] answer {digest}"
+        usage = SimpleNamespace(prompt_token_count=len(prompt.split()), candidates_token_count=len(text.split()))
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+class _FakeCompletions:
+    def create(self, model, messages, **kwargs):
+        time.sleep(FakeGenerativeModel.latency)
+        prompt = repr(messages)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        text = f"[{model}] description {digest}"
+        usage = SimpleNamespace(prompt_tokens=len(prompt.split()), completion_tokens=len(text.split()))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+class FakeOpenAI:
+    def __init__(self, *args, **kwargs):
+        self.chat = SimpleNamespace(completions=_FakeCompletions())
+
+
+class _FakeCredentials:
+    token = "local-token"
+    expired = False
+    valid = True
+
+    def refresh(self, request):
+        pass
+
+
+def _mongomock_bulk_write(self, requests, ordered=True, **kwargs):
+    """mongomock's bulk_write rejects current pymongo UpdateOne objects; apply them one by one."""
+    modified = 0
+    for request in requests:
+        result = self.update_one(request._filter, request._doc, upsert=request._upsert)
+        modified += result.modified_count
+    return SimpleNamespace(modified_count=modified, acknowledged=True)
+
+
+def install(mongo_uri=None, llm_latency=0.0, astra_latency=0.0, gcs_latency=0.0):
+    """
+    Patches the client libraries used by the backend with local stand-ins.
+
+    mongo_uri: use a real (local) mongod at this URI; defaults to mongomock.
+    *_latency: seconds each fake call sleeps, to model upstream round trips.
+    """
+    import pymongo
+    import astrapy
+    import google.auth
+    import openai
+    import vertexai.generative_models
+    from google.cloud import storage, aiplatform
+
+    os.environ.setdefault("ASTRA_DB_API_ENDPOINT", "http://local-astra")
+    os.environ.setdefault("ASTRA_DB_APPLICATION_TOKEN", "local")
+    os.environ.setdefault("ASTRA_DB_COLLECTION", "books")
+
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    else:
+        import mongomock
+        os.environ["MONGO_URI"] = "mongodb://mongomock"
+        pymongo.MongoClient = mongomock.MongoClient
+        mongomock.collection.Collection.bulk_write = _mongomock_bulk_write
+
+    FakeDataAPIClient.database = FakeAstraDatabase(astra_latency)
+    astrapy.DataAPIClient = FakeDataAPIClient
+
+    FakeStorageClient.latency = gcs_latency
+    storage.Client = FakeStorageClient
+
+    FakeGenerativeModel.latency = llm_latency
+    vertexai.generative_models.GenerativeModel = FakeGenerativeModel
+    openai.OpenAI = FakeOpenAI
+
+    google.auth.default = lambda *args, **kwargs: (_FakeCredentials(), "local-project")
+    aiplatform.init = lambda *args, **kwargs: None
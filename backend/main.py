@@ -1,10 +1,13 @@
 # backend/main.py
 import os
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from passlib.hash import bcrypt
 import json
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from bson import ObjectId
 
 # Google cloud
@@ -16,8 +19,8 @@ from google.auth.transport.requests import Request
 
 
 # Fast API
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form,WebSocket
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form,WebSocket, BackgroundTasks, Request as FastAPIRequest
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
@@ -30,6 +33,25 @@ from upload_func import upload_json_data, generate_collection_name, get_or_creat
 from gen_res_func import query_astra_db, generate_chat_response
 from image_func import upload_image_to_gcs
 from image_func import upload_and_share
+import time
+from metrics_func import (
+    get_logger, span, record_llm_tokens, render_metrics, write_snapshot,
+    request_id_var, new_request_id, HTTP_REQUEST_SECONDS,
+)
+from lifecycle import track_llm_call, drain, drain_on_signal, is_draining, check_dependencies
+from coalesce_func import SingleFlight, normalize_query, history_key
+from chunk_store import store_path, write_chunks, read_page, load_index, iter_json_array, STORE_SUFFIX
+from index_func import (
+    INDEX_VERSION, current_index, is_current, retrieval_target, embedding_collection_name,
+    new_index_record, activate_index, run_reindex_job, get_job, is_running,
+)
+from catalogue_func import (
+    get_books_page, page_query, stream_ndjson, parse_fields, parse_cursor,
+    invalidate_catalogue, DEFAULT_PAGE_SIZE,
+)
+from progress_func import ProgressBuffer
+
+logger = get_logger("main")
 
 load_dotenv()
 GLOBAL_COLLECTION = os.getenv("ASTRA_DB_COLLECTION") 
@@ -37,8 +59,24 @@ GOOGLE_PROJECT_ID = os.getenv("GOOGLE_PROJECT_ID")
 GOOGLE_LOCATION = os.getenv("GOOGLE_LOCATION")
 SERVICE_ACCOUNT_JSON = "sincere-song-448114-h6-c6b9c32362d6.json"
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = SERVICE_ACCOUNT_JSON
-
-app = FastAPI()
+# Seconds a stopping worker waits for in-flight requests / LLM calls
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # /ready reports "draining" from the shutdown signal on
+    drain_on_signal(GRACEFUL_TIMEOUT)
+    progress_task = asyncio.create_task(progress_buffer.run())
+    yield
+    # Shutdown: let LLM calls already running in worker threads finish,
+    # within GRACEFUL_TIMEOUT of the signal
+    await drain(GRACEFUL_TIMEOUT)
+    progress_task.cancel()
+    await asyncio.to_thread(progress_buffer.flush)
+    write_snapshot(force=True)
+    logger.info("Worker shut down cleanly")
+
+app = FastAPI(lifespan=lifespan)
 
 # Folder setup
 UPLOAD_FOLDER = "uploads"
@@ -49,6 +87,7 @@ app.mount("/files", StaticFiles(directory=UPLOAD_FOLDER), name="files")
 user_collection = db["user"]
 book_collection = db["book"]
 auth_collection = db["auth"]
+progress_buffer = ProgressBuffer(book_collection)
 
 # Google Cloud Storage setup
 storage_client = storage.Client()
@@ -60,12 +99,22 @@ location = "us-central1"
 
 credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
 credentials.refresh(Request())
+_credentials_lock = threading.Lock()
 
 client = openai.OpenAI(
     base_url=f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/endpoints/openapi",
     api_key=credentials.token,
 )
 
+def get_llm_client():
+    """Returns the OpenAI-compatible Vertex client, refreshing its access token once it expires."""
+    if not credentials.valid:
+        with _credentials_lock:
+            if not credentials.valid:
+                credentials.refresh(Request())
+                client.api_key = credentials.token
+    return client
+
 # Initialize FastAPI
 app.add_middleware(
     CORSMiddleware,
@@ -73,9 +122,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],
 )
 aiplatform.init(project=GOOGLE_PROJECT_ID, location=GOOGLE_LOCATION)
 
+@app.middleware("http")
+async def request_context(request: FastAPIRequest, call_next):
+    """Tags logs with a request id and records per-route latency."""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(elapsed, route=path, method=request.method, status=status_code)
+        write_snapshot()
+        logger.info(
+            "request",
+            extra={"fields": {
+                "method": request.method, "path": path,
+                "status": status_code, "duration_ms": round(elapsed * 1000, 2),
+            }},
+        )
+        request_id_var.reset(token)
+
 # Authentication
 # JWT
 
@@ -124,6 +201,47 @@ def root():
 def ping():
     return {"status": "alive"}
 
+READINESS_CACHE_SECONDS = 5
+_readiness = {"checked_at": 0.0, "result": None}
+
+def _check_mongo():
+    db.client.admin.command("ping")
+
+def _check_astra():
+    database.list_collection_names()
+
+def _check_gcs():
+    if not storage_client.bucket(BUCKET_NAME).exists():
+        raise RuntimeError(f"Bucket {BUCKET_NAME} not found")
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: reports MongoDB, AstraDB, GCS and LLM credential health."""
+    if is_draining():
+        return JSONResponse(status_code=503, content={"status": "draining"})
+
+    # Cache the result briefly so frequent probes don't hammer the dependencies
+    now = time.monotonic()
+    if _readiness["result"] is None or now - _readiness["checked_at"] > READINESS_CACHE_SECONDS:
+        _readiness["result"] = await check_dependencies({
+            "mongo": _check_mongo,
+            "astra": _check_astra,
+            "gcs": _check_gcs,
+            "llm_credentials": get_llm_client,
+        })
+        _readiness["checked_at"] = now
+
+    checks, ok = _readiness["result"]
+    return JSONResponse(
+        status_code=200 if ok else 503,
+        content={"status": "ready" if ok else "unavailable", "checks": checks},
+    )
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/image-response")
 async def image_response(
     image: UploadFile = File(None),
@@ -139,10 +257,11 @@ async def image_response(
 
     try:
         # Get conversation history
-        chat = db.chats.find_one({
-            "userId": ObjectId(userId),
-            "bookId": ObjectId(bookId)
-        })
+        with span("mongo.chat_fetch"):
+            chat = db.chats.find_one({
+                "userId": ObjectId(userId),
+                "bookId": ObjectId(bookId)
+            })
         
         conversation_history = [
             {"role": msg["role"], "content": msg["content"]}
@@ -187,10 +306,13 @@ async def image_response(
         messages.append(current_message)
 
         # Get response from Gemini
-        response = client.chat.completions.create(
-            model="google/gemini-2.0-flash-001",
-            messages=messages,
-        )
+        with track_llm_call(), span("llm.chat_completion", model="google/gemini-2.0-flash-001"):
+            response = get_llm_client().chat.completions.create(
+                model="google/gemini-2.0-flash-001",
+                messages=messages,
+            )
+        if response.usage:
+            record_llm_tokens("google/gemini-2.0-flash-001", response.usage.prompt_tokens, response.usage.completion_tokens)
 
         return {
             "description": response.choices[0].message.content,
@@ -198,7 +320,7 @@ async def image_response(
         }
 
     except Exception as e:
-        print(f"❌ Error during Gemini analysis: {e}")
+        logger.error(f"Error during Gemini analysis: {e}")
         return JSONResponse(
             status_code=500, 
             content={"error": str(e)}
@@ -233,16 +355,42 @@ def protected_route(current_user: str = Depends(get_current_user)):
     return {"message": f"Hello {current_user}, you're authenticated!"}
 
 @app.get("/books")
-async def get_books(username: str= Depends(get_current_user)):
-    """Fetch all books stored in MongoDB."""
+def get_books(
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    after: str | None = None,
+    fields: str | None = None,
+    username: str= Depends(get_current_user),
+):
+    """
+    Fetch a page of the user's books stored in MongoDB.
+
+    `fields=title,progress` limits the returned fields; the `index` record is
+    only returned when listed there. When more books follow, the
+    X-Next-Cursor header holds the `after` value for the next page.
+    """
     try:
-        books = list(book_collection.find({"username": username}, {"_id": 0})) # Exclude MongoDB _id field
-        return books
+        books, next_cursor = get_books_page(username, limit, after, fields)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Failed to fetch books: {str(e)}"}
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return progress_buffer.overlay(username, books)
+
+@app.get("/books/stream")
+def stream_books(fields: str | None = None, username: str = Depends(get_current_user)):
+    """Streams all of the user's books as NDJSON (one book per line)."""
+    projection = parse_fields(fields)
+    return StreamingResponse(
+        stream_ndjson(book_collection, {"username": username}, projection),
+        media_type="application/x-ndjson",
+    )
+
 @app.post("/upload/")
-async def upload_pdf(file: UploadFile = File(...), username: str = Form(...), current_user: str = Depends(get_current_user)):
+async def upload_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...), username: str = Form(...), current_user: str = Depends(get_current_user)):
     """Upload a PDF, extract text, store JSON, and generate embeddings."""
     try:
         file_path = os.path.join(UPLOAD_FOLDER, file.filename)
@@ -257,18 +405,26 @@ async def upload_pdf(file: UploadFile = File(...), username: str = Form(...), cu
  
         # Generate unique collection name
 
-        collection = get_or_create_collection(GLOBAL_COLLECTION)
+        target_name = embedding_collection_name(GLOBAL_COLLECTION)
+        collection = get_or_create_collection(target_name)
 
-        print(f"✅ Successfully processed: {file.filename}")
+        logger.info(f"Successfully processed: {file.filename}")
 
-        existing_in_astra = collection.find_one({"book_id": collection_name})
+        # Books indexed before versioning have chunks but no index record
+        index = current_index(collection_name)
+        existing_in_astra = index is not None or get_or_create_collection(GLOBAL_COLLECTION).find_one({"book_id": collection_name})
         existing_in_mongo = book_collection.find_one(
             {"collectionName": collection_name, "username": username}
         )
 
+        # Indexed with an older chunker/embedding: rebuild in the background
+        if existing_in_astra and not is_current(index):
+            logger.info(f"Index for {collection_name} is not {INDEX_VERSION}, scheduling re-index")
+            background_tasks.add_task(run_reindex_job, collection_name, GLOBAL_COLLECTION, UPLOAD_FOLDER, JSON_FOLDER)
+
         # If the book exists in both, return success without re-inserting
         if existing_in_astra and existing_in_mongo:
-            print(f"✅ Document already exists in both databases: {collection_name}")
+            logger.info(f"Document already exists in both databases: {collection_name}")
             return JSONResponse(
                 content={
                     "status": "exists",
@@ -280,27 +436,36 @@ async def upload_pdf(file: UploadFile = File(...), username: str = Form(...), cu
 
         # If missing in AstraDB, insert it
         if not existing_in_astra:
-            print(f"⚠️ Document missing in AstraDB, adding: {collection_name}")
-            json_filename = f"{file.filename}.json"
-            json_path = os.path.join(JSON_FOLDER, json_filename)
-            with open(json_path, "w", encoding="utf-8") as json_file:
-                json.dump(json_data, json_file, ensure_ascii=False, indent=4)
-            upload_json_data(collection, json_path, collection_name)
+            logger.info(f"Document missing in AstraDB, adding: {collection_name}")
+            chunks_path = store_path(JSON_FOLDER, file.filename)
+            write_chunks(chunks_path, json_data)
+            inserted = upload_json_data(collection, chunks_path, collection_name, INDEX_VERSION)
+            if inserted != len(json_data):
+                # Don't serve a partial index: drop what was inserted so a retry starts clean
+                with span("astra.delete_many", book_id=collection_name):
+                    collection.delete_many({"book_id": collection_name})
+                raise HTTPException(status_code=500, detail=f"Only {inserted} of {len(json_data)} chunks were embedded")
+            index = new_index_record(target_name, inserted)
+            activate_index(collection_name, index)
 
         # If missing in MongoDB, insert it
         if not existing_in_mongo:
-            print(f"⚠️ Document missing in MongoDB, adding: {collection_name}")
-            book_collection.insert_one({
+            logger.info(f"Document missing in MongoDB, adding: {collection_name}")
+            book = {
                 "title": file.filename,
                 "fileUrl": drive_url,
                 "uploadDate": datetime.utcnow().isoformat(),
                 "progress": 0,
                 "collectionName": collection_name,
                 "lastReadPage": None,
-                "username": username
-            })
+                "username": username,
+            }
+            if index is not None:
+                book["index"] = index
+            book_collection.insert_one(book)
+            invalidate_catalogue(username)
 
-        print("✅ Successfully ensured document exists in both databases")
+        logger.info("Successfully ensured document exists in both databases")
         return JSONResponse(
             content={
                 "status": "success",
@@ -311,31 +476,114 @@ async def upload_pdf(file: UploadFile = File(...), username: str = Form(...), cu
         )
 
     except Exception as e:
-        print(f"❌ Error processing PDF: {e}")
+        logger.error(f"Error processing PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {e}")
 
 
+class ProgressUpdate(BaseModel):
+    page: int = Field(ge=1)
+    totalPages: int | None = Field(default=None, ge=1)
+
+@app.post("/books/{collection_name}/progress")
+def update_progress(collection_name: str, update: ProgressUpdate, username: str = Depends(get_current_user)):
+    """
+    Records a page turn. Updates are buffered and written in bulk every few
+    seconds, so this is cheap to call on every page change.
+    """
+    if not progress_buffer.owns(username, collection_name):
+        raise HTTPException(404, "Book not found for this user")
+    return progress_buffer.record(username, collection_name, update.page, update.totalPages)
+
+@app.get("/books/{collection_name}/progress")
+async def get_progress(collection_name: str, since: datetime | None = None, username: str = Depends(get_current_user)):
+    """
+    Reading progress for a book, including page turns not yet written to Mongo.
+
+    With several workers, pass the `progressUpdatedAt` returned by the POST
+    as `since`: the response then includes that update even if another
+    worker buffered it (waiting up to PROGRESS_FLUSH_SECONDS for its flush).
+    """
+    book = await progress_buffer.read(username, collection_name, since)
+    if book is None:
+        raise HTTPException(404, "Book not found for this user")
+    return book
+
+@app.post("/books/{collection_name}/reindex")
+async def reindex(collection_name: str, background_tasks: BackgroundTasks, force: bool = False, current_user: str = Depends(get_current_user)):
+    """Starts a background re-index of a book to the current chunker/embedding version."""
+    if not book_collection.find_one({"collectionName": collection_name}, {"_id": 1}):
+        raise HTTPException(404, "Book not found")
+    job = get_job(collection_name)
+    if is_running(job):
+        return {"status": "running", "version": INDEX_VERSION, "startedAt": job["startedAt"]}
+    background_tasks.add_task(run_reindex_job, collection_name, GLOBAL_COLLECTION, UPLOAD_FOLDER, JSON_FOLDER, force)
+    return {"status": "scheduled", "version": INDEX_VERSION}
+
+@app.get("/books/{collection_name}/reindex")
+async def reindex_status(collection_name: str, current_user: str = Depends(get_current_user)):
+    """Reports the book's active index and its latest re-index job."""
+    return {
+        "currentVersion": INDEX_VERSION,
+        "index": current_index(collection_name),
+        "job": get_job(collection_name),
+    }
+
+
 @app.get("/download/{filename}")
-async def download_json(filename: str):
+async def download_json(filename: str, page: int | None = None):
     """
-    Allows downloading the processed JSON file.
+    Allows downloading the processed chunks.
+
+    - `<book>.pdf.jsonl.gz`: the compressed chunk store (supports Range requests).
+    - `<book>.pdf.jsonl.gz?page=N`: only page N's chunks, as JSON.
+    - `<book>.pdf.json`: the legacy JSON array, streamed from the store if
+      the book has been converted.
     """
-    json_path = os.path.join(JSON_FOLDER, filename)
-    if os.path.exists(json_path):
-        return FileResponse(json_path, media_type="application/json", filename=filename)
+    path = os.path.join(JSON_FOLDER, filename)
+
+    if filename.endswith(STORE_SUFFIX) and os.path.exists(path):
+        if page is not None:
+            chunks = read_page(path, page, load_index(path))
+            if chunks is None:
+                raise HTTPException(status_code=404, detail=f"Page {page} not found.")
+            return chunks
+        return FileResponse(path, media_type="application/gzip", filename=filename)
+
+    if filename.endswith(".json"):
+        if os.path.exists(path):
+            return FileResponse(path, media_type="application/json", filename=filename)
+        converted = path[: -len(".json")] + STORE_SUFFIX
+        if os.path.exists(converted):
+            return StreamingResponse(
+                iter_json_array(converted),
+                media_type="application/json",
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            )
     
     raise HTTPException(status_code=404, detail="File not found.")
 
 
 @app.get("/users/")
-async def get_all_users():
-    """Fetches all users and their uploaded books from MongoDB."""
+def get_all_users(limit: int = DEFAULT_PAGE_SIZE, after: str | None = None):
+    """Fetches a page of users and their uploaded books from MongoDB; pass `next` as `after` for the next page."""
     try:
-        users = list(db["user"].find({}, {"_id": 0}))  # Exclude MongoDB _id
-        return JSONResponse(content={"users": users})
+        users, next_cursor = page_query(user_collection, {}, None, limit, parse_cursor(after))
+        return JSONResponse(content={"users": json.loads(json.dumps(users, default=str)), "next": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching users: {e}")
+
+@app.get("/users/stream")
+def stream_users():
+    """Streams all users as NDJSON (one user per line)."""
+    return StreamingResponse(stream_ndjson(user_collection, {}, None), media_type="application/x-ndjson")
     
+# Identical concurrent questions share one retrieval and one LLM call.
+# Retrieval results are also reused for a short window after completing.
+retrieval_flight = SingleFlight("retrieval", linger=int(os.getenv("RETRIEVAL_COALESCE_WINDOW_MS", 250)) / 1000)
+llm_flight = SingleFlight("llm")
+
 class QueryRequest(BaseModel):
     query: str
     template: str
@@ -348,10 +596,11 @@ async def generate_response(request: QueryRequest, current_user: str = Depends(g
     try:
 
         # Get chat history
-        chat = db.chats.find_one({
-            "userId": ObjectId(request.userId),
-            "bookId": ObjectId(request.bookId)
-        })
+        with span("mongo.chat_fetch"):
+            chat = db.chats.find_one({
+                "userId": ObjectId(request.userId),
+                "bookId": ObjectId(request.bookId)
+            })
 
         user_query = request.query
         template_text = request.template
@@ -369,15 +618,24 @@ async def generate_response(request: QueryRequest, current_user: str = Depends(g
         # print(f"Using collection: {collection_name}")
 
         # Query AstraDB dynamically using the provided collection
-        doc_context = query_astra_db(user_query,GLOBAL_COLLECTION,collection_name)
+        query_key = normalize_query(user_query)
+        astra_collection, index_version = await asyncio.to_thread(retrieval_target, GLOBAL_COLLECTION, collection_name)
+        doc_context = await retrieval_flight.do(
+            (astra_collection, index_version, collection_name, query_key),
+            query_astra_db, user_query, astra_collection, collection_name, index_version,
+        )
 
-        # Generate response using Gemini
-        response = generate_chat_response(user_query, template_text, doc_context,conversation_history)
+        # Generate response using Gemini. The history is part of the prompt,
+        # so only callers with the same history can share an answer.
+        response = await llm_flight.do(
+            (collection_name, template_text, query_key, history_key(conversation_history)),
+            generate_chat_response, user_query, template_text, doc_context, conversation_history,
+        )
         # print(f"Generated response: {response}")
 
         return {"response": response}
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Error generating response: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -506,9 +764,30 @@ async def add_message(book_id: str, request:MessageRequest):
 
 
 if __name__ == "__main__":
+    # python main.py          -> single process with auto-reload (development)
+    # python main.py --prod   -> WEB_CONCURRENCY workers (default: one per core)
+    import argparse
+    import tempfile
     import uvicorn
     from dotenv import load_dotenv
     load_dotenv()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prod", action="store_true", default=os.getenv("APP_ENV") == "production",
+                        help="Run multiple worker processes without auto-reload")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 0)) or os.cpu_count())
+    args = parser.parse_args()
+
     port = int(os.getenv("PORT",10000))
-    print(f"🚀 Server running at: http://0.0.0.0:{port}")
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    if args.prod:
+        # Workers share metrics through snapshot files (see metrics_func)
+        os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="rask-metrics-"))
+        logger.info(f"Server running at: http://0.0.0.0:{port} with {args.workers} workers")
+        uvicorn.run(
+            "main:app", host="0.0.0.0", port=port,
+            workers=args.workers,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        )
+    else:
+        logger.info(f"Server running at: http://0.0.0.0:{port}")
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
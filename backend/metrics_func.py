@@ -0,0 +1,266 @@
+# backend/metrics_func.py
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Request id of the request currently being handled ("-" outside requests)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Seconds; covers fast Mongo lookups up to slow LLM generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+# ---------- Structured logging ----------
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, tagged with the request id."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": request_id_var.get(),
+            "msg": record.getMessage(),
+        }
+        extra = getattr(record, "fields", None)
+        if extra:
+            entry.update(extra)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_logging_configured = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns a logger writing structured JSON lines to stderr."""
+    global _logging_configured
+    if not _logging_configured:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        root = logging.getLogger("rask")
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        root.propagate = False
+        _logging_configured = True
+    return logging.getLogger(f"rask.{name}")
+
+
+# ---------- Metrics ----------
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, values=None):
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, series in values.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], series)]
+            else:
+                total[key] = list(series)
+
+    def render(self, values=None):
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(values.items()):
+            for i, bound in enumerate(self.buckets):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {series[i]}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "rask_http_request_duration_seconds", "HTTP request latency by route, method and status."
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "rask_external_call_duration_seconds", "Latency of calls to Mongo, AstraDB, GCS and the LLM."
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "rask_external_call_errors_total", "External calls that raised an exception."
+)
+LLM_TOKENS = Counter(
+    "rask_llm_tokens_total", "LLM tokens by model and kind (prompt/completion)."
+)
+
+COALESCED_CALLS = Counter(
+    "rask_coalesced_calls_total", "Retrieval/LLM calls by role: leader (ran upstream) or follower (shared a result)."
+)
+
+PROGRESS_EVENTS = Counter(
+    "rask_progress_events_total", "Reading progress (page-turn) events received."
+)
+PROGRESS_WRITES = Counter(
+    "rask_progress_writes_total", "Book progress updates written to Mongo after coalescing."
+)
+
+REGISTRY = [
+    HTTP_REQUEST_SECONDS, EXTERNAL_CALL_SECONDS, EXTERNAL_CALL_ERRORS, LLM_TOKENS, COALESCED_CALLS,
+    PROGRESS_EVENTS, PROGRESS_WRITES,
+]
+
+
+# With several worker processes each one keeps its own metrics. When
+# METRICS_DIR is set, workers periodically write snapshots there and /metrics
+# sums the snapshots of every worker, whichever worker serves the scrape.
+METRICS_DIR = os.getenv("METRICS_DIR")
+SNAPSHOT_INTERVAL = 5.0
+_last_snapshot = 0.0
+
+
+def write_snapshot(force: bool = False):
+    """Writes this worker's metrics to METRICS_DIR (at most every SNAPSHOT_INTERVAL seconds)."""
+    global _last_snapshot
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_snapshot < SNAPSHOT_INTERVAL:
+        return
+    _last_snapshot = now
+
+    data = {
+        metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+        for metric in REGISTRY
+    }
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _merged_snapshots():
+    totals = {metric.name: {} for metric in REGISTRY}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric in REGISTRY:
+            values = {tuple(tuple(pair) for pair in key): value for key, value in data.get(metric.name, [])}
+            metric.merge(totals[metric.name], values)
+    return totals
+
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    totals = None
+    if METRICS_DIR:
+        write_snapshot(force=True)
+        totals = _merged_snapshots()
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(totals[metric.name] if totals else None))
+    return "\n".join(lines) + "\n"
+
+
+_span_logger = get_logger("span")
+
+
+@contextmanager
+def span(call: str, **fields):
+    """
+    Times an external call, recording it in EXTERNAL_CALL_SECONDS and logging it.
+
+        with span("astra.find", book_id=book_id):
+            results = list(collection.find(...))
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        EXTERNAL_CALL_ERRORS.inc(call=call)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        EXTERNAL_CALL_SECONDS.observe(elapsed, call=call)
+        _span_logger.info(
+            "span",
+            extra={"fields": {"call": call, "status": status, "duration_ms": round(elapsed * 1000, 2), **fields}},
+        )
+
+
+def record_llm_tokens(model: str, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
@@ -0,0 +1,154 @@
+# backend/progress_func.py
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from catalogue_func import CatalogueCache, invalidate_catalogue
+from metrics_func import get_logger, span, PROGRESS_EVENTS, PROGRESS_WRITES
+
+logger = get_logger("progress")
+
+FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_SECONDS", 5))
+OWNED_CACHE_SIZE = int(os.getenv("PROGRESS_OWNED_CACHE_SIZE", 10000))
+
+
+class ProgressBuffer:
+    """
+    Buffers page-turn events per (username, book) and writes only the latest
+    one per book, in one bulk write every FLUSH_INTERVAL seconds.
+
+    Reads go through get()/overlay()/read(), which lay pending updates over
+    what is in Mongo, so a reader sees its own page turns before they are
+    flushed. The buffer is per worker process, so with several workers that
+    only holds for read(..., since=...): other reads served by another
+    worker can be up to FLUSH_INTERVAL behind.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._pending = {}  # (username, collectionName) -> fields to $set
+        self._inflight = {}  # batch being written; still visible to readers
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (username, collectionName) pairs known to exist; books are never
+        # deleted, so only hits are cached
+        self._owned = CatalogueCache(OWNED_CACHE_SIZE)
+
+    def owns(self, username: str, collection_name: str) -> bool:
+        """True if the user has this book; checked before buffering so unknown keys never reach a flush."""
+        key = (username, collection_name)
+        if self._owned.get(key):
+            return True
+        if self.collection.find_one({"collectionName": collection_name, "username": username}, {"_id": 1}) is None:
+            return False
+        self._owned.put(key, True)
+        return True
+
+    def record(self, username: str, collection_name: str, page: int, total_pages: int | None = None) -> dict:
+        now = datetime.utcnow()
+        # Millisecond precision, as stored by Mongo, so clients can pass it back as `since`
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        update = {"lastReadPage": page, "progressUpdatedAt": now}
+        if total_pages:
+            update["progress"] = max(0, min(100, round(100 * page / total_pages)))
+        PROGRESS_EVENTS.inc()
+        with self._lock:
+            pending = self._pending.setdefault((username, collection_name), {})
+            pending.update(update)
+            return dict(pending)
+
+    def _unwritten(self, key):
+        """Pending fields for `key`, including a batch whose write has not completed (call with _lock held)."""
+        return {**self._inflight.get(key, {}), **self._pending.get(key, {})}
+
+    def get(self, username: str, collection_name: str):
+        with self._lock:
+            return self._unwritten((username, collection_name)) or None
+
+    async def read(self, username: str, collection_name: str, since: datetime | None = None):
+        """
+        Progress for a book, or None if the user does not have it.
+
+        `since` is a progressUpdatedAt returned by record(). When that update
+        was buffered by another worker, waits until it has been flushed (at
+        most FLUSH_INTERVAL plus a second), so the result includes it.
+        """
+        if since is not None and since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        deadline = time.monotonic() + FLUSH_INTERVAL + 1
+        while True:
+            book = await asyncio.to_thread(
+                self.collection.find_one,
+                {"collectionName": collection_name, "username": username},
+                {"_id": 0, "progress": 1, "lastReadPage": 1, "progressUpdatedAt": 1},
+            )
+            if book is None:
+                return None
+            state = {**book, **(self.get(username, collection_name) or {})}
+            updated = state.get("progressUpdatedAt")
+            if since is None or (updated is not None and updated >= since) or time.monotonic() >= deadline:
+                return state
+            await asyncio.sleep(0.25)
+
+    def overlay(self, username: str, books: list) -> list:
+        """Returns `books` with this user's unflushed progress applied (copies; inputs are not modified)."""
+        with self._lock:
+            keys = {key for key in (*self._inflight, *self._pending) if key[0] == username}
+            mine = {c: self._unwritten((u, c)) for u, c in keys}
+        if not mine:
+            return books
+
+        result = []
+        for book in books:
+            pending = mine.get(book.get("collectionName"))
+            if pending:
+                # Only fields the caller asked for (the page may be projected)
+                book = {**book, **{k: v for k, v in pending.items() if k in book}}
+            result.append(book)
+        return result
+
+    def flush(self) -> int:
+        """Writes all pending updates; returns the number of books written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+
+            operations = [
+                UpdateOne({"username": username, "collectionName": collection_name}, {"$set": fields})
+                for (username, collection_name), fields in batch.items()
+            ]
+            try:
+                with span("mongo.progress_bulk_write", updates=len(operations)):
+                    self.collection.bulk_write(operations, ordered=False)
+                # Cached /books pages hold the old values until this bump
+                invalidate_catalogue({username for username, _ in batch})
+            except Exception as e:
+                logger.error(f"Progress flush failed, will retry: {e}")
+                with self._lock:
+                    # Keep newer events recorded during the failed write
+                    for key, fields in batch.items():
+                        self._pending[key] = {**fields, **self._pending.get(key, {})}
+                    self._inflight = {}
+                return 0
+
+            with self._lock:
+                self._inflight = {}
+            PROGRESS_WRITES.inc(len(operations))
+            return len(operations)
+
+    async def run(self, interval: float = FLUSH_INTERVAL):
+        """Flushes every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                # One bad flush must not stop the later ones
+                logger.error(f"Progress flush loop error: {e}")
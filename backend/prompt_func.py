@@ -0,0 +1,242 @@
+# backend/prompt_func.py
+import os
+import re
+import hashlib
+from metrics_func import get_logger
+
+logger = get_logger("prompt")
+
+# Rough per-model prompt budgets (in tokens). These are cost/latency budgets,
+# not the model's context window.
+MODEL_TOKEN_BUDGETS = {
+    "gemini-2.0-flash": 6000,
+    "google/gemini-2.0-flash-001": 6000,
+}
+DEFAULT_TOKEN_BUDGET = 4000
+HISTORY_SHARE = 0.35  # Max share of the remaining budget given to history
+TRUNCATION_SUFFIX = " ..."
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+PROMPT_TEMPLATE = """{template}
+
+CONVERSATION HISTORY:
+{history}
+-------------
+DOCUMENT CONTEXT:
+{context}
+END CONTEXT
+-------------
+CURRENT QUERY : {query}
+
+INSTRUCTIONS:
+1. Maintain conversation flow naturally
+2. Reference previous messages when relevant
+3. Keep responses concise but helpful"""
+
+
+def get_token_budget(model_name: str) -> int:
+    """Returns the prompt token budget for a model (PROMPT_TOKEN_BUDGET overrides)."""
+    override = os.getenv("PROMPT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximates the token count of `text`.
+
+    Counts words and punctuation marks, which tracks SentencePiece/BPE
+    tokenizers closely enough for budgeting without a network round trip.
+    """
+    if not text:
+        return 0
+    return len(_TOKEN_RE.findall(text))
+
+
+def _shingles(text: str, size: int = 5):
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe_chunks(chunks, overlap_threshold: float = 0.8):
+    """
+    Drops retrieved chunks that repeat an earlier (higher ranked) chunk.
+
+    A chunk is a duplicate if its normalised text is identical to a kept chunk,
+    or if most of its word 5-grams already appear in a kept chunk.
+    """
+    kept = []
+    seen_hashes = set()
+    kept_shingles = []
+
+    for chunk in chunks:
+        text = " ".join((chunk or "").split())
+        if not text:
+            continue
+
+        digest = hashlib.sha1(text.lower().encode("utf-8")).hexdigest()
+        if digest in seen_hashes:
+            continue
+
+        shingles = _shingles(text)
+        if any(len(shingles & other) / len(shingles) >= overlap_threshold for other in kept_shingles):
+            continue
+
+        seen_hashes.add(digest)
+        kept_shingles.append(shingles)
+        kept.append(text)
+
+    return kept
+
+
+def trim_history(conversation_history, budget: int):
+    """Keeps the most recent messages whose formatted lines fit in `budget` tokens."""
+    kept = []
+    used = 0
+    for msg in reversed(conversation_history):
+        line = f"{msg['role'].upper()}: {msg['content']}"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept, used
+
+
+def trim_context(chunks, budget: int):
+    """Keeps chunks in rank order until `budget` tokens are used; the last one may be cut short."""
+    kept = []
+    used = 0
+    for chunk in chunks:
+        line = f"{len(kept) + 1}. {chunk}"
+        cost = count_tokens(line)
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+            continue
+
+        remaining = budget - used
+        if remaining > 20:
+            words = line.split()
+            # Tokens run slightly above words, so shrink until it fits with the suffix
+            while words and count_tokens(" ".join(words)) + count_tokens(TRUNCATION_SUFFIX) > remaining:
+                words = words[:int(len(words) * 0.9)]
+            if words:
+                kept.append(" ".join(words) + TRUNCATION_SUFFIX)
+                used += count_tokens(kept[-1])
+        break
+    return kept, used
+
+
+def build_prompt(query, template, context_chunks, conversation_history, model_name="gemini-2.0-flash"):
+    """
+    Assembles the chat prompt within the model's token budget.
+
+    The template and query are always kept; history gets at most
+    HISTORY_SHARE of what remains and document context gets the rest.
+    Returns the prompt and a dict of size metrics.
+    """
+    if isinstance(context_chunks, str):
+        context_chunks = [context_chunks] if context_chunks else []
+
+    budget = get_token_budget(model_name)
+    fixed = count_tokens(PROMPT_TEMPLATE.format(template=template or "", history="", context="", query=query))
+    remaining = max(budget - fixed, 0)
+
+    history_lines, history_tokens = trim_history(conversation_history or [], int(remaining * HISTORY_SHARE))
+    chunks = dedupe_chunks(context_chunks)
+    context_lines, context_tokens = trim_context(chunks, remaining - history_tokens)
+
+    prompt = PROMPT_TEMPLATE.format(
+        template=template or "",
+        history="\n".join(history_lines),
+        context="\n".join(context_lines),
+        query=query,
+    )
+
+    metrics = {
+        "model": model_name,
+        "budget": budget,
+        "prompt_tokens": count_tokens(prompt),
+        "history_tokens": history_tokens,
+        "context_tokens": context_tokens,
+        "history_messages": f"{len(history_lines)}/{len(conversation_history or [])}",
+        "context_chunks": f"{len(context_lines)}/{len(context_chunks)}",
+        "duplicate_chunks": len(context_chunks) - len(chunks),
+    }
+    return prompt, metrics
+
+
+def log_prompt_metrics(metrics):
+    logger.info(
+        f"Prompt {metrics['prompt_tokens']}/{metrics['budget']} tokens "
+        f"(history {metrics['history_tokens']} in {metrics['history_messages']} msgs, "
+        f"context {metrics['context_tokens']} in {metrics['context_chunks']} chunks, "
+        f"{metrics['duplicate_chunks']} duplicates dropped)",
+        extra={"fields": metrics},
+    )
+
+
+if __name__ == "__main__":
+    # Compares the old prompt assembly with build_prompt() on the sample books
+    # in json_files. Retrieval is simulated with 5 consecutive chunks plus one
+    # repeated hit, and a 10 message history.
+    #   python prompt_func.py
+    import glob
+    import json
+
+    def legacy_prompt(query, template, context, conversation_history):
+        history_str = "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in conversation_history)
+        return f"""
+    {template}
+
+    CONVERSATION HISTORY:
+    {history_str}
+    -------------
+    DOCUMENT CONTEXT:
+    {json.dumps(context, indent=2)}
+    END CONTEXT
+    -------------
+    CURRENT QUERY : {query}
+
+    INSTRUCTIONS:
+    1. Maintain conversation flow naturally
+    2. Reference previous messages when relevant
+    3. Keep responses concise but helpful
+    """
+
+    json_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_files")
+    template = "You are a helpful tutor. Explain clearly using the document context."
+    query = "Can you summarise the key ideas on this page?"
+
+    total_old = total_new = 0
+    print(f"{'book':<32} {'legacy':>8} {'new':>8} {'saved':>7}")
+    for path in sorted(glob.glob(os.path.join(json_folder, "*.json"))):
+        with open(path, "r", encoding="utf8") as file:
+            paragraphs = [p["text"] for p in json.load(file)]
+        if not paragraphs:
+            continue
+
+        retrieved = paragraphs[:5] + paragraphs[:1]
+        history = []
+        for i in range(5):
+            history.append({"role": "user", "content": paragraphs[i % len(paragraphs)][:300]})
+            history.append({"role": "assistant", "content": paragraphs[(i + 1) % len(paragraphs)]})
+
+        old_context = "\n".join(f"{i}. {text}" for i, text in enumerate(retrieved, 1))
+        old_tokens = count_tokens(legacy_prompt(query, template, old_context, history))
+        _, metrics = build_prompt(query, template, retrieved, history)
+        new_tokens = metrics["prompt_tokens"]
+
+        total_old += old_tokens
+        total_new += new_tokens
+        saved = 100 * (old_tokens - new_tokens) / old_tokens
+        print(f"{os.path.basename(path)[:32]:<32} {old_tokens:>8} {new_tokens:>8} {saved:>6.1f}%")
+
+    if total_old:
+        print(f"{'TOTAL':<32} {total_old:>8} {total_new:>8} {100 * (total_old - total_new) / total_old:>6.1f}%")
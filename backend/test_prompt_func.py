@@ -0,0 +1,101 @@
+# backend/test_prompt_func.py
+#   cd backend && python -m pytest test_prompt_func.py
+import pytest
+
+from prompt_func import build_prompt, count_tokens, dedupe_chunks, trim_context, trim_history
+
+TEMPLATE = "You are a helpful tutor."
+QUERY = "What is symmetric encryption?"
+
+
+def _paragraph(topic, words=120):
+    return " ".join(f"{topic}{i}" for i in range(words))
+
+
+def _history(messages=20):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + _paragraph(f"h{i}x", 60)}
+        for i in range(messages)
+    ]
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET", "600")
+    return 600
+
+
+def test_prompt_stays_within_budget(small_budget):
+    chunks = [_paragraph(f"c{n}x") for n in range(10)]
+    prompt, metrics = build_prompt(QUERY, TEMPLATE, chunks, _history())
+
+    assert metrics["budget"] == small_budget
+    assert count_tokens(prompt) == metrics["prompt_tokens"]
+    assert metrics["prompt_tokens"] <= small_budget
+
+
+@pytest.mark.parametrize("words", range(90, 120))
+def test_cut_chunk_suffix_fits_budget(words):
+    # Around 100 words the shrunk chunk lands exactly on the budget before the suffix
+    lines, used = trim_context([_paragraph("c", words)], 100)
+
+    assert used == sum(count_tokens(line) for line in lines)
+    assert used <= 100
+
+
+def test_single_long_chunk_within_budget(monkeypatch):
+    monkeypatch.setenv("PROMPT_TOKEN_BUDGET", "300")
+    _, metrics = build_prompt(QUERY, TEMPLATE, [_paragraph("c", 262)], [])
+
+    assert metrics["prompt_tokens"] <= 300
+
+
+def test_template_and_query_always_kept(small_budget):
+    chunks = [_paragraph(f"c{n}x", 1000) for n in range(3)]
+    prompt, _ = build_prompt(QUERY, TEMPLATE, chunks, _history(40))
+
+    assert prompt.startswith(TEMPLATE)
+    assert f"CURRENT QUERY : {QUERY}" in prompt
+
+
+def test_history_keeps_newest_messages():
+    history = _history(20)
+    lines, used = trim_history(history, 200)
+
+    assert 0 < len(lines) < len(history)
+    assert used <= 200
+    kept = history[-len(lines):]
+    assert lines == [f"{m['role'].upper()}: {m['content']}" for m in kept]
+
+
+def test_history_gets_limited_share(small_budget):
+    _, metrics = build_prompt(QUERY, TEMPLATE, [_paragraph("c", 1000)], _history())
+    kept, total = map(int, metrics["history_messages"].split("/"))
+
+    assert kept < total
+    assert metrics["context_tokens"] > metrics["history_tokens"]
+
+
+def test_duplicate_chunks_dropped():
+    first = _paragraph("alpha")
+    near_copy = first + " trailing"
+    other = _paragraph("beta")
+    chunks = [first, "  " + first.upper() + "  ", near_copy, other]
+
+    assert dedupe_chunks(chunks) == [first, other]
+
+    _, metrics = build_prompt(QUERY, TEMPLATE, chunks, [])
+    assert metrics["duplicate_chunks"] == 2
+    assert metrics["context_chunks"] == "2/4"
+
+
+def test_context_in_rank_order_and_last_chunk_cut(small_budget):
+    chunks = [_paragraph(f"c{n}x", 200) for n in range(5)]
+    prompt, metrics = build_prompt(QUERY, TEMPLATE, chunks, [])
+
+    assert "1. c0x0" in prompt
+    assert prompt.index("1. c0x0") < prompt.index("2. c1x0")
+    assert metrics["context_chunks"] == "3/5"
+    cut = next(line for line in prompt.splitlines() if line.startswith("3. c2x0"))
+    assert cut.endswith(" ...")
+    assert "c2x199" not in cut
@@ -1,11 +1,23 @@
 # backend/upload_func.py
-import json
 import hashlib
 from astrapy.constants import VectorMetric
 from astrapy.info import CollectionVectorServiceOptions
 from connect_to_database import database
 from PyPDF2 import PdfReader
 from fastapi import HTTPException
+from chunk_store import iter_chunks
+from metrics_func import get_logger, span
+
+logger = get_logger("upload")
+
+# Bump CHUNKER_VERSION whenever extract_text_from_pdf's output changes, and
+# the embedding constants when switching models; index_func re-indexes
+# books whose recorded versions differ.
+CHUNK_MAX_CHARS = 700
+CHUNKER_VERSION = f"words{CHUNK_MAX_CHARS}-v1"
+EMBEDDING_PROVIDER = "nvidia"
+EMBEDDING_MODEL = "NV-Embed-QA"
+EMBEDDING_VERSION = f"{EMBEDDING_PROVIDER}/{EMBEDDING_MODEL}"
 
 def generate_collection_name(file_path):
     """Generates a SHA-256 hash of the PDF content to use as a unique collection name."""
@@ -17,7 +29,7 @@ def generate_collection_name(file_path):
 
     return hasher.hexdigest()[:16]
 
-def get_or_create_collection(collection_name: str):
+def get_or_create_collection(collection_name: str, provider: str = EMBEDDING_PROVIDER, model_name: str = EMBEDDING_MODEL):
     """
     Checks if a collection exists; if not, creates it with vector search enabled.
     """
@@ -27,45 +39,72 @@ def get_or_create_collection(collection_name: str):
         if collection_name in collections:
             return database.get_collection(collection_name)
 
-        print(f"⚙️ Creating new collection: {collection_name}...")
+        logger.info(f"Creating new collection: {collection_name}")
         collection = database.create_collection(
             collection_name,
             metric=VectorMetric.COSINE,
             service=CollectionVectorServiceOptions(
-                provider="nvidia",
-                model_name="NV-Embed-QA",
+                provider=provider,
+                model_name=model_name,
             ),
         )
-        print(f"✅ Collection '{collection.full_name}' created successfully.")
+        logger.info(f"Collection '{collection.full_name}' created successfully")
         return collection
 
     except Exception as e:
-        print(f"❌ Error creating collection: {e}")
+        logger.error(f"Error creating collection: {e}")
+
+INSERT_BATCH_SIZE = 500
 
-def upload_json_data(collection, data_file_path: str,book_id : str):
+def chunk_hash(chunk) -> str:
+    """Content hash of a chunk; unchanged chunks keep their embedding across re-indexes."""
+    key = f"{chunk.get('page')}|{chunk.get('paragraph')}|{chunk.get('text', '')}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def upload_json_data(collection, data_file_path: str,book_id : str, index_version: str = None):
     """
-    Uploads JSON data to AstraDB collection with vector embeddings.
+    Uploads chunks from a chunk store (or legacy JSON file) to AstraDB with vector embeddings.
+    Chunks are streamed and inserted in batches rather than loaded all at once.
+    Returns the number of inserted chunks.
     """
     try:
-        with open(data_file_path, "r", encoding="utf8") as file:
-            json_data = json.load(file)
+        return insert_chunks(collection, iter_chunks(data_file_path), book_id, index_version)
+    except Exception as e:
+        logger.error(f"Error inserting data: {e}")
+        return 0
 
-        documents = [
-            {**data,"book_id":book_id,"$vectorize": f"text: {data['text']}"}  
-            for data in json_data
-        ]
 
-        inserted = collection.insert_many(documents)
-        print(f"✅ Inserted {len(inserted.inserted_ids)} items successfully.")
+def insert_chunks(collection, chunks, book_id: str, index_version: str = None):
+    """Embeds and inserts chunks in batches, tagging them with their hash and index version."""
+    total = 0
+    batch = []
+    for data in chunks:
+        document = {**data,"book_id":book_id,"$vectorize": f"text: {data['text']}"}
+        if index_version:
+            document["chunk_hash"] = chunk_hash(data)
+            document["index_versions"] = [index_version]
+        batch.append(document)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            total += _insert_batch(collection, batch, book_id)
+            batch = []
+    if batch:
+        total += _insert_batch(collection, batch, book_id)
+
+    logger.info(f"Inserted {total} items successfully")
+    return total
 
-    except Exception as e:
-        print(f"❌ Error inserting data: {e}")
 
 
+def _insert_batch(collection, documents, book_id):
+    with span("astra.insert_many", book_id=book_id, documents=len(documents)):
+        inserted = collection.insert_many(documents)
+    return len(inserted.inserted_ids)
+
 
 def extract_text_from_pdf(file_path):
     """
-    Extracts text from a PDF and splits it into paragraphs with a max length of 700 characters.
+    Extracts text from a PDF and splits it into paragraphs with a max length of CHUNK_MAX_CHARS characters.
     """
     extracted_paragraphs = []
 
@@ -76,7 +115,7 @@ def extract_text_from_pdf(file_path):
             for i, page in enumerate(reader.pages, 1):
                 text = page.extract_text() or ""  # Extract text, avoid None values
 
-                # Splitting into paragraphs when text length exceeds 700 chars
+                # Splitting into paragraphs when text length exceeds CHUNK_MAX_CHARS
                 words = text.split()
                 current_paragraph = []
                 current_length = 0
@@ -86,7 +125,7 @@ def extract_text_from_pdf(file_path):
                     current_paragraph.append(word)
                     current_length += len(word) + 1  # +1 for spaces
 
-                    if current_length >= 700:
+                    if current_length >= CHUNK_MAX_CHARS:
                         extracted_paragraphs.append({
                             "page": i,
                             "paragraph": paragraph_count,
@@ -24,6 +24,8 @@ const BACKEND_URL = import.meta.env.VITE_BACKEND_URL;
 const Dashboard = () => {
   const [books, setBooks] = useState<BookData[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState(0);
   const [uploadError, setUploadError] = useState<string | null>(null);
@@ -31,18 +33,25 @@ const Dashboard = () => {
   const { username, logout } = useAuth();
   const navigate = useNavigate();
 
+  // /books is paginated: X-Next-Cursor holds the `after` value of the next page
+  const fetchBooksPage = async (after?: string) => {
+    const token = localStorage.getItem("token");
+
+    const response = await axios.get(`${BACKEND_URL}/books`, {
+      headers: {
+        Authorization: `Bearer ${token}`
+      },
+      params: after ? { after } : undefined
+    });
+
+    setBooks(prev => (after ? [...prev, ...response.data] : response.data));
+    setNextCursor(response.headers['x-next-cursor'] || null);
+  };
+
   useEffect(() => {
     const fetchBooks = async () => {
       try {
-        const token = localStorage.getItem("token");
-
-        const response = await axios.get(`${BACKEND_URL}/books`, {
-          headers: {
-            Authorization: `Bearer ${token}`
-          }
-        });
-
-        setBooks(response.data);
+        await fetchBooksPage();
       } catch (error) {
         console.error('Error fetching books:', error);
       } finally {
@@ -53,6 +62,18 @@ const Dashboard = () => {
     fetchBooks();
   }, []);
 
+  const handleLoadMore = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      await fetchBooksPage(nextCursor);
+    } catch (error) {
+      console.error('Error fetching more books:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
 
   const handleContinueReading = (book: BookData) => {
     navigate(`/reader/${book.collectionName}`, {
@@ -196,7 +217,20 @@ const Dashboard = () => {
         ) : books.length === 0 ? (
           <EmptyLibraryCard />
         ) : (
-          <BookGrid books={books} handleContinueReading={handleContinueReading} />
+          <>
+            <BookGrid books={books} handleContinueReading={handleContinueReading} />
+            {nextCursor && (
+              <div className="flex justify-center mt-10">
+                <button
+                  onClick={handleLoadMore}
+                  disabled={isLoadingMore}
+                  className="px-6 py-2.5 bg-white text-indigo-600 rounded-xl shadow-md hover:shadow-lg transition-all duration-300 font-medium disabled:opacity-60"
+                >
+                  {isLoadingMore ? 'Loading...' : 'Load more books'}
+                </button>
+              </div>
+            )}
+          </>
         )}
       </div>
 